@@ -7,13 +7,18 @@ except RuntimeError:
     
 import streamlit as st
 st.set_page_config(layout="wide")
-from naac_agent import create_rag_agent, create_sql_agent, create_supervisor_agent  # Import your agent
+from naac_agent import create_rag_agent, create_sql_agent, create_supervisor_agent, get_rag_stats  # Import your agent
 from langchain_core.messages import AIMessage
 
-# Load the agents
-rag_agent = create_rag_agent()
-sql_agent = create_sql_agent()
-supervisor_agent = create_supervisor_agent(sql_agent, rag_agent)
+# Load the agents once per server process, so the retrieval caches are shared across questions and reruns
+@st.cache_resource
+def load_agents():
+    rag_agent, rag_retriever = create_rag_agent()
+    sql_agent = create_sql_agent()
+    supervisor_agent = create_supervisor_agent(sql_agent, rag_agent)
+    return supervisor_agent, rag_retriever
+
+supervisor_agent, rag_retriever = load_agents()
 
 # Streamlit UI
 st.title("KNAACK: Know about NAAC Accredited Institutes and Universities")
@@ -31,6 +36,7 @@ with st.form("my_form"):
         with st.spinner("Fetching answer..."):
             # Call the supervisor agent with the user's question, using stream
             result = supervisor_agent.invoke({"messages": [{"role": "user", "content": question}]})
+        print("RAG retrieval stats:", get_rag_stats(rag_retriever))
 
         st.write("Answer:")
         response_parts = []
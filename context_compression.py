@@ -0,0 +1,252 @@
+# This module compresses the peer team report chunks returned by the RAG retriever before they reach the LLM.
+import math
+import re
+from collections import Counter, OrderedDict
+from typing import Optional, Sequence
+
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor, Document
+
+CHARS_PER_TOKEN = 4
+# Chunks are split with a 200 character overlap in create_vector_database
+MAX_CHUNK_OVERLAP = 200
+MIN_CHUNK_OVERLAP = 20
+# Share of each retrieval's prompt tokens that is sent to the LLM. The budget is taken from the result set
+# itself, since the self-query retriever lets the model choose the limit.
+CONTEXT_BUDGET_RATIO = 0.8
+# How the retriever tool formats each chunk for the LLM
+DOCUMENT_PROMPT = "College: {college_name}\n{page_content}"
+UNKNOWN_COLLEGE = "unknown"
+MAX_HEADER_LINE_LENGTH = 120
+CHUNK_SEPARATOR = "\n...\n"
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Share of the re-ranking score taken from the vector store's order; the rest comes from BM25
+RETRIEVAL_RANK_WEIGHT = 0.5
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text):
+    """Rough token count for Gemini, which averages about four characters per token for English text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def count_tokens(documents):
+    return sum(estimate_tokens(doc.page_content) for doc in documents)
+
+
+def prompt_tokens(doc):
+    """Tokens a document takes once the retriever tool formats it with DOCUMENT_PROMPT."""
+    return estimate_tokens(DOCUMENT_PROMPT.format(college_name=doc.metadata.get("college_name"), page_content=doc.page_content))
+
+
+def count_prompt_tokens(documents):
+    return sum(prompt_tokens(doc) for doc in documents)
+
+
+def token_budget_for(documents):
+    """Budget for a result set: CONTEXT_BUDGET_RATIO of the tokens it would take in the prompt."""
+    return int(count_prompt_tokens(documents) * CONTEXT_BUDGET_RATIO)
+
+
+def overlap_length(first, second):
+    """Return the length of the longest suffix of first that is a prefix of second."""
+    for length in range(min(len(first), len(second), MAX_CHUNK_OVERLAP), MIN_CHUNK_OVERLAP - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+def merge_texts(texts):
+    """Combine chunks of the same page, dropping chunks contained in another and stitching overlapping ones."""
+    merged = []
+    for text in texts:
+        text = text.strip()
+        for index, existing in enumerate(merged):
+            if text in existing:
+                break
+            if existing in text:
+                merged[index] = text
+                break
+            overlap = overlap_length(existing, text)
+            if overlap:
+                merged[index] = existing + text[overlap:]
+                break
+            overlap = overlap_length(text, existing)
+            if overlap:
+                merged[index] = text + existing[overlap:]
+                break
+        else:
+            merged.append(text)
+    return merged
+
+
+def page_key(doc):
+    return (doc.metadata.get("source"), doc.metadata.get("page"), doc.metadata.get("college_name"))
+
+
+def merge_page_chunks(documents):
+    """Merge the chunks that come from the same report page into one document, in retrieval order."""
+    pages = OrderedDict()
+    for doc in documents:
+        pages.setdefault(page_key(doc), []).append(doc)
+    merged_documents = []
+    for docs in pages.values():
+        texts = merge_texts(doc.page_content for doc in docs)
+        # A later chunk can bridge two earlier ones, so merge until nothing changes
+        while len(texts) > 1:
+            merged = merge_texts(texts)
+            if len(merged) == len(texts):
+                break
+            texts = merged
+        metadata = dict(docs[0].metadata)
+        # DOCUMENT_PROMPT needs a college name for every document
+        if not metadata.get("college_name"):
+            metadata["college_name"] = UNKNOWN_COLLEGE
+        merged_documents.append(Document(page_content=CHUNK_SEPARATOR.join(texts), metadata=metadata))
+    return merged_documents
+
+
+def drop_duplicate_documents(documents):
+    """Drop documents whose whitespace-normalized text has already been seen for the same college."""
+    seen = set()
+    unique = []
+    for doc in documents:
+        key = (doc.metadata.get("college_name"), " ".join(doc.page_content.split()).lower())
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(doc)
+    return unique
+
+
+def edge_lines(text):
+    """Return the first and last non-empty lines of a page, where headers and footers sit."""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return {lines[0], lines[-1]} if lines else set()
+
+
+def strip_repeated_page_furniture(documents):
+    """Drop a header or footer line from a document when an earlier document of the same college already carries it.
+    Only the first and last lines of each document are considered, and documents left empty are dropped."""
+    seen = set()
+    stripped = []
+    for doc in documents:
+        college_name = doc.metadata.get("college_name")
+        furniture = {line for line in edge_lines(doc.page_content) if len(line) <= MAX_HEADER_LINE_LENGTH}
+        repeated = {line for line in furniture if (college_name, line) in seen}
+        seen |= {(college_name, line) for line in furniture}
+        if repeated:
+            lines = doc.page_content.splitlines()
+            non_empty = [index for index, line in enumerate(lines) if line.strip()]
+            edges = {non_empty[0], non_empty[-1]}
+            lines = [line for index, line in enumerate(lines) if not (index in edges and line.strip() in repeated)]
+            if not any(line.strip() for line in lines):
+                continue
+            doc = Document(page_content="\n".join(lines), metadata=doc.metadata)
+        stripped.append(doc)
+    return stripped
+
+
+def tokenize(text):
+    return WORD_PATTERN.findall(text.lower())
+
+
+def rerank(documents, query):
+    """Order the documents by a blend of their position in the vector store's results and their
+    BM25 score against the query, computed over the retrieved set."""
+    if len(documents) < 2:
+        return list(documents)
+    document_terms = [tokenize(doc.page_content) for doc in documents]
+    average_length = sum(len(terms) for terms in document_terms) / len(documents) or 1
+    document_frequency = Counter()
+    for terms in document_terms:
+        document_frequency.update(set(terms))
+    query_terms = set(tokenize(query))
+    scores = []
+    for terms in document_terms:
+        term_counts = Counter(terms)
+        score = 0.0
+        for term in query_terms:
+            if term not in term_counts:
+                continue
+            idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            frequency = term_counts[term]
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * (1 - BM25_B + BM25_B * len(terms) / average_length))
+        scores.append(score)
+    best_score = max(scores) or 1
+    blended = [
+        RETRIEVAL_RANK_WEIGHT / (rank + 1) + (1 - RETRIEVAL_RANK_WEIGHT) * score / best_score
+        for rank, score in enumerate(scores)
+    ]
+    order = sorted(range(len(documents)), key=lambda index: -blended[index])
+    return [documents[index] for index in order]
+
+
+def trim_to_budget(documents, token_budget):
+    """Keep the highest ranked documents that fit in the token budget, truncating the first if it alone is too long."""
+    kept = []
+    used = 0
+    for doc in documents:
+        tokens = prompt_tokens(doc)
+        if used + tokens <= token_budget:
+            kept.append(doc)
+            used += tokens
+        elif not kept:
+            prefix_tokens = tokens - estimate_tokens(doc.page_content)
+            content_chars = max(0, token_budget - prefix_tokens) * CHARS_PER_TOKEN
+            kept.append(Document(page_content=doc.page_content[:content_chars], metadata=doc.metadata))
+            used = token_budget
+    return kept
+
+
+class ChunkCompressor(BaseDocumentCompressor):
+    """Merge and de-duplicate retrieved chunks, then re-rank and trim them to the token budget, recording the tokens saved.
+    Without a fixed token_budget, the budget is CONTEXT_BUDGET_RATIO of each retrieval's prompt tokens."""
+
+    token_budget: Optional[int] = None
+    questions: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+    last_question: dict = {}
+
+    def compress_documents(
+        self,
+        documents: Sequence[Document],
+        query: str,
+        callbacks: Optional[Callbacks] = None,
+    ) -> Sequence[Document]:
+        # The tool sent bare page_content before compression, and sends DOCUMENT_PROMPT after it
+        raw_tokens = count_tokens(documents)
+        token_budget = self.token_budget or token_budget_for(documents)
+        compressed = merge_page_chunks(documents)
+        compressed = drop_duplicate_documents(compressed)
+        if count_prompt_tokens(compressed) > token_budget:
+            compressed = rerank(compressed, query)
+            compressed = trim_to_budget(compressed, token_budget)
+        compressed = strip_repeated_page_furniture(compressed)
+        compressed_tokens = count_prompt_tokens(compressed)
+
+        self.questions += 1
+        self.tokens_before += raw_tokens
+        self.tokens_after += compressed_tokens
+        self.last_question = {
+            "chunks_before": len(documents),
+            "chunks_after": len(compressed),
+            "tokens_before": raw_tokens,
+            "tokens_after": compressed_tokens,
+            "tokens_saved": raw_tokens - compressed_tokens,
+        }
+        return compressed
+
+    def compression_stats(self):
+        """Return the token counts of the last question and the running totals across all questions."""
+        saved = self.tokens_before - self.tokens_after
+        return {
+            "last_question": self.last_question,
+            "questions": self.questions,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": saved,
+            "tokens_saved_per_question": round(saved / self.questions, 1) if self.questions else 0.0,
+        }
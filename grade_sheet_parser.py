@@ -0,0 +1,278 @@
+# This module parses the criterion-wise and key-indicator-wise tables from NAAC grade sheet PDFs.
+import re
+import json
+
+REJECTS_FILE = "grade_sheet_rejects.ndjson"
+CRITERIA_NUMBERS = {1, 2, 3, 4, 5, 6, 7}
+MAX_GRADE_POINT = 4.0
+WEIGHTAGE_TOLERANCE = 0.5
+
+CRITERIA_HEADING = r"criteri(on|a)[\s-]*wise"
+KEY_INDICATOR_HEADING = r"key[\s-]*indicators?"
+NUMBER_PATTERN = re.compile(r"^\d+(\.\d+)?$")
+
+# Each grade sheet layout seen across NAAC cycles is described by a strategy:
+#   detect            - called with the page numbers holding each heading, returns True if the layout matches
+#   criteria_columns  - default column positions of the criterion table
+#   key_indicator_columns - default column positions of the key indicator table (None if the layout has none)
+#   total_weightage   - the sum the seven criterion weightages must add up to
+GRADE_SHEET_FORMATS = [
+    {
+        "name": "revised_accreditation_framework",
+        "detect": lambda criteria_pages, key_indicator_pages: bool(criteria_pages) and bool(key_indicator_pages),
+        "criteria_columns": {"number": 0, "weightage": 2, "weighted_grade_point": 3, "grade_point_average": 4},
+        "key_indicator_columns": {"number": 0, "weightage": 2, "weighted_grade_point": 3},
+        "total_weightage": 1000,
+    },
+    {
+        "name": "criteria_only",
+        "detect": lambda criteria_pages, key_indicator_pages: bool(criteria_pages) and not key_indicator_pages,
+        "criteria_columns": {"number": 0, "weightage": 2, "weighted_grade_point": 3, "grade_point_average": 4},
+        "key_indicator_columns": None,
+        "total_weightage": 1000,
+    },
+]
+
+# Keywords used to locate columns from a table's header row, checked in order
+COLUMN_KEYWORDS = [
+    ("grade_point_average", ("average", "gpa")),
+    ("weighted_grade_point", ("weighted",)),
+    ("weightage", ("weightage",)),
+]
+
+
+def detect_grade_sheet_format(criteria_pages, key_indicator_pages):
+    """Return the first grade sheet format whose detector matches, or None."""
+    for grade_sheet_format in GRADE_SHEET_FORMATS:
+        if grade_sheet_format["detect"](criteria_pages, key_indicator_pages):
+            return grade_sheet_format
+    return None
+
+
+def page_has_ruling(page):
+    """Tables in the grade sheets are ruled, so a page without lines or rects holds no table."""
+    return bool(page.lines or page.rects)
+
+
+def find_headings(pdf_file):
+    """Return ({page_index: top}, {page_index: top}) for the criterion and key indicator headings.
+    The scan stops once both headings are found; the key indicator tables that continue onto later pages are picked up by key_indicator_regions.
+    The tables start on the second page, so the cover page is only searched if they are not found after it."""
+    pattern = f"({CRITERIA_HEADING})|({KEY_INDICATOR_HEADING})"
+    criteria_pages = {}
+    key_indicator_pages = {}
+    page_order = list(range(1, len(pdf_file.pages))) + [0]
+    for page_index in page_order:
+        if criteria_pages and key_indicator_pages:
+            break
+        page = pdf_file.pages[page_index]
+        for match in page.search(pattern, regex=True, case=False):
+            if re.search(KEY_INDICATOR_HEADING, match["text"], re.IGNORECASE):
+                headings = key_indicator_pages
+            else:
+                headings = criteria_pages
+            headings[page_index] = min(headings.get(page_index, match["top"]), match["top"])
+    return criteria_pages, key_indicator_pages
+
+
+def criteria_regions(pdf_file, criteria_pages, key_indicator_pages):
+    """Yield the cropped regions that may hold the criterion table, in page order."""
+    for page_index in sorted(criteria_pages):
+        page = pdf_file.pages[page_index]
+        if not page_has_ruling(page):
+            continue
+        top = criteria_pages[page_index]
+        # Stop at the key indicator heading if it follows on the same page
+        bottom = key_indicator_pages.get(page_index, page.height)
+        if bottom <= top:
+            bottom = page.height
+        yield page_index, page.crop((0, top, page.width, bottom))
+
+
+def key_indicator_regions(pdf_file, key_indicator_pages):
+    """Yield the cropped regions holding the key indicator tables, from the first heading up to the first page without a table."""
+    first_page = min(key_indicator_pages)
+    for page_index in range(first_page, len(pdf_file.pages)):
+        page = pdf_file.pages[page_index]
+        if not page_has_ruling(page):
+            return
+        top = key_indicator_pages.get(page_index, 0)
+        yield page_index, page.crop((0, top, page.width, page.height))
+
+
+def clean_row(row):
+    """Remove \\n and \\r from each cell and strip surrounding whitespace."""
+    return [cell.replace('\n', ' ').replace('\r', ' ').strip() if isinstance(cell, str) else cell for cell in row]
+
+
+def is_number(cell):
+    return isinstance(cell, str) and NUMBER_PATTERN.match(cell) is not None
+
+
+def columns_from_header(table, default_columns):
+    """Locate the value columns from the header row, falling back to the format's default positions."""
+    columns = dict(default_columns)
+    for row in table:
+        row = clean_row(row)
+        if row and is_number(row[0]):
+            break
+        found = {}
+        for index, cell in enumerate(row):
+            if not isinstance(cell, str):
+                continue
+            lowered = cell.lower()
+            for column, keywords in COLUMN_KEYWORDS:
+                if column in default_columns and column not in found and any(keyword in lowered for keyword in keywords):
+                    found[column] = index
+                    break
+        if "weightage" in found:
+            columns.update(found)
+            break
+    return columns
+
+
+def make_reject(reason, page_index=None, row=None):
+    return {"reason": reason, "page": page_index, "row": row}
+
+
+def parse_table_rows(table, columns, page_index, is_valid_number, rejects):
+    """Yield (number, values) for each data row of the table, recording unparseable rows in rejects."""
+    for row in table:
+        row = clean_row(row)
+        if not row or not is_number(row[0]):
+            # Header, title and total rows
+            continue
+        number = float(row[0])
+        if not is_valid_number(number):
+            if int(number) in CRITERIA_NUMBERS:
+                # A criterion row inside a key indicator table or vice versa
+                continue
+            rejects.append(make_reject(f"unexpected number {row[0]} in table", page_index, row))
+            continue
+        try:
+            values = {column: float(row[index]) for column, index in columns.items() if column != "number"}
+        except (IndexError, ValueError, TypeError):
+            rejects.append(make_reject("non-numeric value in data row", page_index, row))
+            continue
+        yield number, values
+
+
+def is_criterion_number(number):
+    return number in CRITERIA_NUMBERS
+
+
+def is_key_indicator_number(number):
+    return int(number) in CRITERIA_NUMBERS and number != int(number)
+
+
+def extract_criteria(pdf_file, grade_sheet_format, criteria_pages, key_indicator_pages, rejects):
+    """Return {criterion_no: values} from the criterion table."""
+    criteria = {}
+    for page_index, region in criteria_regions(pdf_file, criteria_pages, key_indicator_pages):
+        for table in region.extract_tables():
+            columns = columns_from_header(table, grade_sheet_format["criteria_columns"])
+            for number, values in parse_table_rows(table, columns, page_index, is_criterion_number, rejects):
+                if number in criteria:
+                    rejects.append(make_reject(f"duplicate criterion {number}", page_index, values))
+                    continue
+                criteria[number] = values
+        if CRITERIA_NUMBERS <= set(criteria):
+            break
+    return criteria
+
+
+def extract_key_indicators(pdf_file, grade_sheet_format, key_indicator_pages, rejects):
+    """Return {key_indicator_no: values} from the key indicator tables."""
+    key_indicators = {}
+    if grade_sheet_format["key_indicator_columns"] is None:
+        return key_indicators
+    for page_index, region in key_indicator_regions(pdf_file, key_indicator_pages):
+        found_before = len(key_indicators)
+        for table in region.extract_tables():
+            columns = columns_from_header(table, grade_sheet_format["key_indicator_columns"])
+            for number, values in parse_table_rows(table, columns, page_index, is_key_indicator_number, rejects):
+                if number in key_indicators:
+                    rejects.append(make_reject(f"duplicate key indicator {number}", page_index, values))
+                    continue
+                key_indicators[number] = values
+        if key_indicators and len(key_indicators) == found_before:
+            # A page without any key indicator rows after they started means the tables have ended
+            break
+    return key_indicators
+
+
+def validate_criteria(criteria, grade_sheet_format):
+    """Return the list of problems that make the criterion table unusable."""
+    problems = []
+    missing = sorted(CRITERIA_NUMBERS - set(criteria))
+    if missing:
+        problems.append(f"missing criteria {missing}")
+    total_weightage = sum(values["weightage"] for values in criteria.values())
+    if not missing and abs(total_weightage - grade_sheet_format["total_weightage"]) > WEIGHTAGE_TOLERANCE:
+        problems.append(f"criterion weightages sum to {total_weightage}, expected {grade_sheet_format['total_weightage']}")
+    for number, values in sorted(criteria.items()):
+        grade_point_average = values.get("grade_point_average")
+        if grade_point_average is not None and not 0 <= grade_point_average <= MAX_GRADE_POINT:
+            problems.append(f"criterion {number} grade point average {grade_point_average} out of range")
+    return problems
+
+
+def validate_key_indicators(key_indicators, criteria):
+    """Return the criteria whose key indicators are missing or whose weightages do not add up to the criterion weightage."""
+    totals = {}
+    for number, values in key_indicators.items():
+        totals[int(number)] = totals.get(int(number), 0) + values["weightage"]
+    mismatched = {}
+    for criterion_no in sorted(CRITERIA_NUMBERS - set(totals)):
+        mismatched[criterion_no] = f"no key indicator rows found for criterion {criterion_no}"
+    for criterion_no, total in totals.items():
+        if criterion_no not in criteria:
+            continue
+        expected = criteria[criterion_no]["weightage"]
+        if abs(total - expected) > WEIGHTAGE_TOLERANCE:
+            mismatched[criterion_no] = f"key indicator weightages for criterion {criterion_no} sum to {total}, expected {expected}"
+    return mismatched
+
+
+def parse_grade_sheet(pdf_file):
+    """Parse an open pdfplumber grade sheet.
+    Returns a dict with the detected format name, the validated criteria and key indicator values and the rejects."""
+    rejects = []
+    criteria_pages, key_indicator_pages = find_headings(pdf_file)
+    result = {"format": None, "criteria": {}, "key_indicators": {}, "rejects": rejects}
+
+    grade_sheet_format = detect_grade_sheet_format(criteria_pages, key_indicator_pages)
+    if grade_sheet_format is None:
+        rejects.append(make_reject("unrecognised grade sheet layout"))
+        return result
+    result["format"] = grade_sheet_format["name"]
+
+    criteria = extract_criteria(pdf_file, grade_sheet_format, criteria_pages, key_indicator_pages, rejects)
+    problems = validate_criteria(criteria, grade_sheet_format)
+    if problems:
+        # Without a complete criterion table the sheet cannot be trusted, so nothing is kept
+        rejects.extend(make_reject(problem) for problem in problems)
+        return result
+    result["criteria"] = criteria
+
+    if grade_sheet_format["key_indicator_columns"] is None:
+        return result
+    key_indicators = extract_key_indicators(pdf_file, grade_sheet_format, key_indicator_pages, rejects)
+    mismatched = validate_key_indicators(key_indicators, criteria)
+    for criterion_no, problem in mismatched.items():
+        rejects.append(make_reject(problem))
+    result["key_indicators"] = {
+        number: values for number, values in key_indicators.items() if int(number) not in mismatched
+    }
+    return result
+
+
+def write_rejects(rejects, aishe_id, source, grade_sheet_format=None, rejects_file=REJECTS_FILE):
+    """Append the rejects for a grade sheet to the rejects log, one JSON record per line."""
+    if not rejects:
+        return
+    with open(rejects_file, 'a', encoding='utf-8') as file:
+        for reject in rejects:
+            record = {"aishe_id": aishe_id, "source": source, "format": grade_sheet_format}
+            record.update(reject)
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
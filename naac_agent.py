@@ -9,9 +9,12 @@ from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from pinecone import Pinecone
 from langchain_pinecone import PineconeVectorStore
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.retrievers.self_query.base import SelfQueryRetriever
+from retrieval_cache import CachedEmbeddings, CachedSelfQueryRetriever
+from context_compression import ChunkCompressor, DOCUMENT_PROMPT
+from langchain.retrievers import ContextualCompressionRetriever
 from langchain.chains.query_constructor.base import AttributeInfo
 from langchain.tools.retriever import create_retriever_tool
+from langchain_core.prompts import PromptTemplate
 import streamlit as st
 load_dotenv()
 # st.write("GOOGLE_API_KEY", st.secrets["GOOGLE_API_KEY"])
@@ -31,13 +34,15 @@ def load_vector_database():
     index_name = "naac-index"
     # Initialize index client
     index = pc.Index(name=index_name)
-    embeddings_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+    # Cache query embeddings so repeated questions skip the embedding call
+    embeddings_model = CachedEmbeddings(GoogleGenerativeAIEmbeddings(model="models/embedding-001"))
     vector_store = PineconeVectorStore(index=index, embedding=embeddings_model)
     print("Vector database loaded.")
     return vector_store
 
 def create_retriever(vector_store):
-    """Query the vector database with a question."""
+    """Query the vector database with a question.
+    Returns the retriever tool and the retriever behind it, whose caches report their hit rates."""
 
     metadata_field_info = [
     AttributeInfo(
@@ -56,20 +61,37 @@ def create_retriever(vector_store):
         max_retries=2,
         # other params...
     )
-    retriever = SelfQueryRetriever.from_llm(
+    # Cache the constructed filters and search results so repeated and refined queries
+    # avoid both the LLM call and the vector store round-trip
+    retriever = CachedSelfQueryRetriever.from_llm(
         llm,
         vector_store,
         "NAAC peer team report chunk",
         metadata_field_info=metadata_field_info,
         enable_limit=True,
     )
+    # De-duplicate, merge, re-rank and trim the retrieved chunks before they are sent to Gemini
+    compression_retriever = ContextualCompressionRetriever(
+        base_compressor=ChunkCompressor(),
+        base_retriever=retriever,
+    )
     retriever_tool = create_retriever_tool(
-        retriever,
+        compression_retriever,
         "retrieve_naac_information_from_vector_db",
         "retrieve information from the NAAC vector database, which has information about the NAAC Peer Reports of various colleges.",
+        # Name the college with each chunk so the agent can tell which report it comes from;
+        # ChunkCompressor counts this prefix in its token accounting
+        document_prompt=PromptTemplate.from_template(DOCUMENT_PROMPT),
     )
 
-    return retriever_tool
+    return retriever_tool, compression_retriever
+
+def get_rag_stats(rag_retriever):
+    """Return the hit rates of the retrieval caches and the tokens saved by compression behind the RAG tool."""
+    return {
+        "cache": rag_retriever.base_retriever.cache_stats(),
+        "compression": rag_retriever.base_compressor.compression_stats(),
+    }
 
 def create_sql_agent():
     db = SQLDatabase.from_uri("sqlite:///naac_accreditation.db")
@@ -114,9 +136,10 @@ def create_sql_agent():
     return sql_agent
 
 def create_rag_agent():
-    """Create a RAG agent that can answer questions about NAAC Peer Team Reports."""
+    """Create a RAG agent that can answer questions about NAAC Peer Team Reports.
+    Returns the agent and its retriever, which can be passed to get_rag_stats."""
     vector_store = load_vector_database()
-    retriever_tool = create_retriever(vector_store)
+    retriever_tool, rag_retriever = create_retriever(vector_store)
     
     # Create the RAG agent
     rag_agent = create_react_agent(
@@ -132,7 +155,7 @@ def create_rag_agent():
         checkpointer=False
     )
     
-    return rag_agent
+    return rag_agent, rag_retriever
 
 def create_supervisor_agent(sql_agent, rag_agent):
     """Create a supervisor agent that can manage the RAG agent and SQL agent."""
@@ -9,9 +9,12 @@ GRADE_SHEET_FOLDER = "Grade_Sheet_Report"
 IIQA_FOLDER = "IIQA_Report"
 PEER_TEAM_REPORT_FOLDER = "Peer_Team_Report"
 SSR_REPORT_FOLDER = "SSR_Report"
+NAAC_DATA_FILE = "naac_accreditation_data_final_all.ndjson"
+PAGE_SIZE = 500
 
-def scrape_from_naac_accreditation_website():
-    """Scrape the NAAC table from the NAAC website and save it as a JSON file. As of 6/7/2025, there are 9119 entries in the table."""
+def scrape_from_naac_accreditation_website(naac_data_file=NAAC_DATA_FILE, page_size=PAGE_SIZE):
+    """Scrape the NAAC table from the NAAC website and save it as a NDJSON file (one record per line).
+    The table is fetched page by page so only one page is held in memory at a time. As of 6/7/2025, there are 9119 entries in the table."""
     # Start a session to handle cookies
     session = requests.Session()
 
@@ -90,11 +93,14 @@ def scrape_from_naac_accreditation_website():
         "columns[8][search][regex]":"false",
         "order[0][column]":"5",
         "order[0][dir]":"desc",
+        # Many records share a submission date, so break ties on the id to keep the paging order stable
+        "order[1][column]":"0",
+        "order[1][dir]":"asc",
         "start":"0",
-        "length":"9119",
+        "length":str(page_size),
         "search[value]":"",
         "search[regex]":"false",
-        "_":"1751810503713"
+        "_":str(timestamp)
     }
 
     headers = {
@@ -102,15 +108,50 @@ def scrape_from_naac_accreditation_website():
         "Referer": MAIN_URL,
         "Accept": "application/json, text/javascript, */*; q=0.01",
     }   
-    data_resp = session.get(MAIN_URL, params=params, headers=headers)
-
-    ## Download this as a file
-    with open('naac_accreditation_data_final_all.json', 'w', encoding='utf-8') as file:
-        file.write(data_resp.text)
-    #print(data_resp.text)
+    ## Write each page to the file as it arrives, one record per line
+    start = 0
+    draw = 1
+    records_total = None
+    seen_ids = set()
+    duplicates = 0
+    with open(naac_data_file, 'w', encoding='utf-8') as file:
+        while records_total is None or start < records_total:
+            params["start"] = str(start)
+            params["draw"] = str(draw)
+            data_resp = session.get(MAIN_URL, params=params, headers=headers)
+            page = data_resp.json()
+            records_total = int(page.get("recordsFiltered", page.get("recordsTotal", 0)))
+            records = page.get("data", [])
+            if not records:
+                break
+            for entry in records:
+                if entry.get("hei_assessment_id") in seen_ids:
+                    duplicates += 1
+                    continue
+                seen_ids.add(entry.get("hei_assessment_id"))
+                file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            print(f"Fetched records {start + 1} to {start + len(records)} of {records_total}")
+            start += len(records)
+            draw += 1
 
+    print(f"Wrote {len(seen_ids)} unique records ({duplicates} duplicates skipped)")
+    if records_total is not None and len(seen_ids) != records_total:
+        print(f"Warning: expected {records_total} records but wrote {len(seen_ids)}; the table changed or paging was unstable while scraping")
     return None
 
+def iter_naac_records(naac_data_file=NAAC_DATA_FILE):
+    """Yield the NAAC records one at a time from the NDJSON file written by the scraper.
+    Older dumps saved as a single JSON document ({"data": [...]}) are still supported, but are loaded in full."""
+    with open(naac_data_file, 'r', encoding='utf-8') as file:
+        if naac_data_file.endswith('.json'):
+            for entry in json.load(file)['data']:
+                yield entry
+            return
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
 def download_reports_for_institution(hei_assessment_id, aishe_id):
     """Download the NAAC Peer Team Report and Grade Sheet for a given HEI Assessment ID"""
     base_url = f"{MAIN_URL}/{hei_assessment_id}"
@@ -177,23 +218,24 @@ def check_report_already_exists(aishe_id):
         return True
     return False
 
-def download_naac_reports(naac_data_file):
-    """Download the NAAC Peer Team Report and Grade Sheet from the json file"""
-    #Read the JSON file
-    with open(naac_data_file, 'r', encoding='utf-8') as file:
-        data = json.load(file)
-    for entry in data['data']:
-        hei_assessment_id = entry['hei_assessment_id']
-        aishe_id = entry['aishe_id']
-        if check_report_already_exists(aishe_id):
-            print(f"Report already exists for HEI Assessment ID: {hei_assessment_id}")
-            continue
-        print(f"Downloading reports for HEI Assessment ID: {hei_assessment_id}")
-        download_reports_for_institution(hei_assessment_id=hei_assessment_id, aishe_id=aishe_id)
-        #time.sleep(1)
+def download_reports_for_entry(entry):
+    """Download the reports for a single NAAC record unless they are already on disk"""
+    hei_assessment_id = entry['hei_assessment_id']
+    aishe_id = entry['aishe_id']
+    if check_report_already_exists(aishe_id):
+        print(f"Report already exists for HEI Assessment ID: {hei_assessment_id}")
+        return
+    print(f"Downloading reports for HEI Assessment ID: {hei_assessment_id}")
+    download_reports_for_institution(hei_assessment_id=hei_assessment_id, aishe_id=aishe_id)
+    #time.sleep(1)
+
+def download_naac_reports(naac_data_file=NAAC_DATA_FILE):
+    """Download the NAAC Peer Team Report and Grade Sheet for each record in the data file"""
+    for entry in iter_naac_records(naac_data_file):
+        download_reports_for_entry(entry)
 
 if __name__ == "__main__":
     print("Starting script...")
     #Uncomment the following lines when you want to scrape the NAAC Website
-    #scrape_naac_accreditation()
-    #download_naac_reports(naac_data_file='naac_accreditation_data_final_all.json')
\ No newline at end of file
+    #scrape_from_naac_accreditation_website()
+    #download_naac_reports(naac_data_file=NAAC_DATA_FILE)
\ No newline at end of file
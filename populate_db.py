@@ -1,9 +1,12 @@
 import time
 import pdfplumber
-from naac_website_scraper import GRADE_SHEET_FOLDER, PEER_TEAM_REPORT_FOLDER
+from pdfplumber.utils.exceptions import PdfminerException
+from pdfminer.pdfparser import PDFSyntaxError
+from pdfminer.psparser import PSException
+from naac_website_scraper import GRADE_SHEET_FOLDER, PEER_TEAM_REPORT_FOLDER, iter_naac_records, download_reports_for_entry
 import os
 import sqlite3
-import json
+from grade_sheet_parser import parse_grade_sheet, write_rejects, make_reject
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.document_loaders import PyPDFLoader
@@ -33,10 +36,25 @@ def create_db(conn):
     # Commit and close
     conn.commit()
 
-def insert_institution_details(entry,conn):
-    """Insert a single NAAC accreditation record into the database."""
+INSTITUTION_BATCH_SIZE = 500
+
+def _institution_row(entry):
+    """Map a NAAC record to an institution_details row."""
+    return (
+        entry.get('hei_assessment_id'),
+        entry.get('hei_name'),
+        entry.get('aishe_id'),
+        entry.get('other_address'),
+        entry.get('state_name'),
+        entry.get('iiqa_submitted_date'),
+        entry.get('date_of_decleration'),
+        entry.get('grade')
+    )
+
+def insert_institution_details_batch(entries,conn):
+    """Insert a batch of NAAC accreditation records into the database in a single transaction."""
     cursor = conn.cursor()
-    cursor.execute('''
+    cursor.executemany('''
         INSERT OR REPLACE INTO institution_details (
             hei_assessment_id,
             hei_name,
@@ -47,26 +65,32 @@ def insert_institution_details(entry,conn):
             date_of_decleration,
             grade
         ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        entry.get('hei_assessment_id'),
-        entry.get('hei_name'),
-        entry.get('aishe_id'),
-        entry.get('other_address'),
-        entry.get('state_name'),
-        entry.get('iiqa_submitted_date'),
-        entry.get('date_of_decleration'),
-        entry.get('grade')
-    ))
+    ''', [_institution_row(entry) for entry in entries])
     conn.commit()
 
-# Example usage: insert all entries from your JSON file
-def insert_all_from_json(naac_data_file,conn):
-    
-    with open(naac_data_file, 'r', encoding='utf-8') as file:
-        data = json.load(file)
-    for entry in data['data']:
-        print("Adding entry:", entry['hei_name'], "to the database...")
-        insert_institution_details(entry,conn)
+def insert_institution_details(entry,conn):
+    """Insert a single NAAC accreditation record into the database."""
+    insert_institution_details_batch([entry],conn)
+
+# Example usage: insert all entries from your NDJSON file
+def insert_all_from_json(naac_data_file,conn,batch_size=INSTITUTION_BATCH_SIZE,download_reports=False):
+    """Stream the records from the data file into the database, committing every batch_size records.
+    With download_reports=True the reports for each record are downloaded in the same pass over the file."""
+    batch = []
+    total = 0
+    for entry in iter_naac_records(naac_data_file):
+        batch.append(entry)
+        if download_reports:
+            download_reports_for_entry(entry)
+        if len(batch) >= batch_size:
+            insert_institution_details_batch(batch,conn)
+            total += len(batch)
+            print(f"Added {total} entries to the database...")
+            batch = []
+    if batch:
+        insert_institution_details_batch(batch,conn)
+        total += len(batch)
+    print(f"Added {total} entries to the database.")
 
 def create_criteria_table(conn):
     """Create a table for criteria and key indicators."""
@@ -154,16 +178,12 @@ def create_criteria_wise_grade_table(conn):
     conn.commit()
 
 def insert_criteria_wise_grades(data,conn):
-    """Insert the NAAC criteria-wise grades into the table."""
+    """Insert the NAAC criteria-wise grades into the table. The caller commits."""
     cursor = conn.cursor()
-    try:
-        cursor.executemany(
-            "INSERT INTO criteria_wise_grades (aishe_id, criterion_no, weightage, criterion_wise_weighted_grade_point, criterion_wise_gpa) VALUES (?, ?, ?, ?, ?)", data
-        )
-        conn.commit()
-    except:
-        print(f"Data causing error in insert_criteria_wise_grades: {data}")
-    
+    cursor.executemany(
+        "INSERT INTO criteria_wise_grades (aishe_id, criterion_no, weightage, criterion_wise_weighted_grade_point, criterion_wise_gpa) VALUES (?, ?, ?, ?, ?)", data
+    )
+
 
 def create_key_indicators_table(conn):
     """Create a table for key indicators."""
@@ -182,15 +202,18 @@ def create_key_indicators_table(conn):
     conn.commit()
 
 def insert_key_indicators_grades(data,conn):
-    """Insert the NAAC key indicators grades into the table."""
-    try:
-        cursor = conn.cursor()
-        cursor.executemany(
-            "INSERT INTO key_indicators_grades (aishe_id, criterion_no, key_indicator_weightage, key_indicator_weigtage_gpa) VALUES (?, ?, ?, ?)", data
-        )
-        conn.commit()
-    except:
-        print("Error inserting data for key indicators grades:", data)
+    """Insert the NAAC key indicators grades into the table. The caller commits."""
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO key_indicators_grades (aishe_id, criterion_no, key_indicator_weightage, key_indicator_weigtage_gpa) VALUES (?, ?, ?, ?)", data
+    )
+
+
+def delete_grades_for_institution(aishe_id,conn):
+    """Delete the criteria-wise and key indicator grades stored for an institution. The caller commits."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM criteria_wise_grades WHERE aishe_id=?", (aishe_id,))
+    cursor.execute("DELETE FROM key_indicators_grades WHERE aishe_id=?", (aishe_id,))
 
 
 def create_database_and_tables(conn):
@@ -203,72 +226,75 @@ def create_database_and_tables(conn):
     print("Database created and tables populated successfully.")
 
 
-def extract_grades_from_pdf(pdf_file,aishe_id,conn):
-    """Extract grades from the PDF file."""
-    tables = []
-    # Extract tables from the first page
-    tables.extend(pdf_file.pages[1].extract_tables())
-    for i, table in enumerate(tables):
-        #print(f"Table {i+1}:")
-        for row in table:
-            #remove \n and \r from each cell
-            row = [cell.replace('\n', ' ').replace('\r', ' ') if isinstance(cell, str) else cell for cell in row]
-            #print(row)
-            #if row[0] is an integer or float, print it as is
-            # Check if the first element of the row contains digits
-            try:
-                float(row[0])
-                data = (
-                    aishe_id,
-                    float(row[0]),  # criterion_no
-                    float(row[2]),  # criterion_weightage
-                    float(row[3]),  # criterion_weighted_grade_point
-                    float(row[4]),  # criterion_gpa
-                )
-                # Insert the data into the key_indicators_grades table
-                insert_criteria_wise_grades([data],conn)
-            except (ValueError, TypeError):
-                # If it raises an error, it means it's not a number
-                pass
-
-    tables = []
-    for p in range(2,len(pdf_file.pages)):
-        p = pdf_file.pages[p]
-        tables.extend(p.extract_tables())
-
-
-    for i, table in enumerate(tables):
-        #print(f"Table {i+1}:")
-        for row in table:
-            #remove \n and \r from each cell
-            row = [cell.replace('\n', ' ').replace('\r', ' ') if isinstance(cell, str) else cell for cell in row]
-            #print(row)
-            #if row[0] is an integer or float, print it as is
-            # Check if the first element of the row contains digits
-            try:
-                float(row[0])
-                data = (
-                    aishe_id,
-                    float(row[0]),  # criterion_no
-                    float(row[2]),  # key_indicator_weightage
-                    float(row[3]),  # key_indicator_weigtage_gpa
-                )
-                # Insert the data into the key_indicators_grades table
-                insert_key_indicators_grades([data],conn)
-            except (ValueError, TypeError):
-                # If it raises an error, it means it's not a number
-                pass
+PDF_READ_ERRORS = (PDFSyntaxError, PSException, PdfminerException)
+
+def extract_grades_from_pdf(pdf_file,aishe_id,conn,source=None):
+    """Extract grades from the PDF file, inserting the validated rows and logging the rejected ones."""
+    result = parse_grade_sheet(pdf_file)
+    rejects = result["rejects"]
+    criteria_data = [
+        (
+            aishe_id,
+            criterion_no,
+            values["weightage"],
+            values["weighted_grade_point"],
+            values["grade_point_average"],
+        )
+        for criterion_no, values in sorted(result["criteria"].items())
+    ]
+    key_indicator_data = [
+        (
+            aishe_id,
+            key_indicator_no,
+            values["weightage"],
+            values["weighted_grade_point"],
+        )
+        for key_indicator_no, values in sorted(result["key_indicators"].items())
+    ]
+    # Write the sheet as one transaction so a failure leaves none of its rows behind.
+    # A sheet that passed validation replaces the rows from any earlier run, so reruns do not duplicate them.
+    try:
+        if criteria_data:
+            delete_grades_for_institution(aishe_id,conn)
+            insert_criteria_wise_grades(criteria_data,conn)
+        if key_indicator_data:
+            insert_key_indicators_grades(key_indicator_data,conn)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        rejects.append(make_reject(f"database error: {e}"))
+    write_rejects(rejects, aishe_id, source, result["format"])
+    if rejects:
+        print(f"{len(rejects)} rejects logged for {aishe_id} ({result['format']})")
+    return result
 
 def extract_grades_from_pdf_folder(folder_path,conn):
     """Extract grades from all PDF files in the specified folder."""
     for filename in os.listdir(folder_path):
         if filename.endswith('.pdf'):
             pdf_file_path = os.path.join(folder_path, filename)
+            # Extract the AISHE ID from the filename
+            aishe_id = filename.split('_')[0]
             print(f"Processing file: {pdf_file_path}")
-            with pdfplumber.open(pdf_file_path) as pdf_file:
-                # Extract the AISHE ID from the filename
-                aishe_id = filename.split('_')[0]
-                extract_grades_from_pdf(pdf_file, aishe_id,conn)
+            pdf_file = None
+            try:
+                pdf_file = pdfplumber.open(pdf_file_path)
+                # Reading the page tree surfaces truncated or corrupt downloads up front
+                pdf_file.pages
+            except PDF_READ_ERRORS as e:
+                if pdf_file is not None:
+                    pdf_file.close()
+                write_rejects([make_reject(f"unreadable PDF: {e}")], aishe_id, pdf_file_path)
+                print(f"Could not read file: {pdf_file_path}")
+                continue
+            with pdf_file:
+                try:
+                    extract_grades_from_pdf(pdf_file, aishe_id,conn,source=pdf_file_path)
+                except PDF_READ_ERRORS as e:
+                    # pdfplumber parses page content lazily, so a broken page stream only fails here
+                    write_rejects([make_reject(f"unreadable page content: {e}")], aishe_id, pdf_file_path)
+                    print(f"Could not read file: {pdf_file_path}")
+                    continue
             print(f"Finished processing file: {pdf_file_path}")
 
 def get_institution_name(aishe_id):
@@ -336,7 +362,7 @@ if __name__ == "__main__":
     #Uncomment the following lines when you want to create and populate the DB for the first time
     #conn = sqlite3.connect('naac_accreditation.db')
     # create_database_and_tables(conn)
-    # insert_all_from_json(naac_data_file='naac_accreditation_data_final_all.json',conn=conn)
+    # insert_all_from_json(naac_data_file='naac_accreditation_data_final_all.ndjson',conn=conn,download_reports=True)
     # extract_grades_from_pdf_folder(GRADE_SHEET_FOLDER,conn)
     #conn.close()
 
@@ -0,0 +1,158 @@
+# This module caches query embeddings, self-query filters and search results for the RAG retriever tool.
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain.retrievers.self_query.base import SelfQueryRetriever
+from pydantic import Field
+
+EMBEDDING_CACHE_SIZE = 512
+EMBEDDING_CACHE_TTL = 60 * 60
+FILTER_CACHE_SIZE = 256
+FILTER_CACHE_TTL = 60 * 60
+RESULT_CACHE_SIZE = 128
+RESULT_CACHE_TTL = 10 * 60
+
+
+def normalize_query(query):
+    """Lower-case the query and drop punctuation and repeated whitespace so near-identical queries share a key."""
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire ttl seconds after they are stored."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "hit_rate": round(self.hit_rate, 3)}
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap an embeddings model so repeated query embeddings are served from a cache."""
+
+    def __init__(self, embeddings, cache=None):
+        self.embeddings = embeddings
+        self.cache = cache or TTLCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL)
+
+    def embed_query(self, text):
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+
+def _search_key(query, search_kwargs):
+    """Key a vector store search by its query text and the constructed filter and limit."""
+    return normalize_query(query) + "|" + json.dumps(search_kwargs, sort_keys=True, default=str)
+
+
+class CachedSelfQueryRetriever(SelfQueryRetriever):
+    """A SelfQueryRetriever that caches the structured query built by the LLM for each question,
+    and the documents returned by the vector store for each constructed query and filter."""
+
+    filter_cache: Any = Field(default_factory=lambda: TTLCache(FILTER_CACHE_SIZE, FILTER_CACHE_TTL))
+    result_cache: Any = Field(default_factory=lambda: TTLCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL))
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        query_key = normalize_query(query)
+        structured_query = self.filter_cache.get(query_key)
+        if structured_query is None:
+            structured_query = self.query_constructor.invoke(
+                {"query": query}, config={"callbacks": run_manager.get_child()}
+            )
+            self.filter_cache.set(query_key, structured_query)
+        new_query, search_kwargs = self._prepare_query(query, structured_query)
+        search_key = _search_key(new_query, search_kwargs)
+        docs = self.result_cache.get(search_key)
+        if docs is None:
+            docs = self._get_docs_with_query(new_query, search_kwargs)
+            self.result_cache.set(search_key, docs)
+        return list(docs)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        query_key = normalize_query(query)
+        structured_query = self.filter_cache.get(query_key)
+        if structured_query is None:
+            structured_query = await self.query_constructor.ainvoke(
+                {"query": query}, config={"callbacks": run_manager.get_child()}
+            )
+            self.filter_cache.set(query_key, structured_query)
+        new_query, search_kwargs = self._prepare_query(query, structured_query)
+        search_key = _search_key(new_query, search_kwargs)
+        docs = self.result_cache.get(search_key)
+        if docs is None:
+            docs = await self._aget_docs_with_query(new_query, search_kwargs)
+            self.result_cache.set(search_key, docs)
+        return list(docs)
+
+    def cache_stats(self):
+        """Return the hit/miss counts and hit rates of the filter, result and query embedding caches."""
+        stats = {"filters": self.filter_cache.stats(), "results": self.result_cache.stats()}
+        embeddings = getattr(self.vectorstore, "embeddings", None)
+        if isinstance(embeddings, CachedEmbeddings):
+            stats["embeddings"] = embeddings.cache.stats()
+        return stats